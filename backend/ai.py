@@ -1,26 +1,224 @@
 import os
 import google.generativeai as genai
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
-import fitz # PyMuPDF
+import hashlib
+import json
+import re
 import io
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pdf_cache import get_doc, render_pages_jpeg, copy_page_range, pdf_executor, PAGES_PER_TASK
 
 
 # Configure Gemini
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+MODEL_NAME = 'gemini-flash-latest'
+
+# Matches markdown code fences (```json / ```) the model sometimes wraps its JSON in
+_FENCE_RE = re.compile(r"```(?:json)?\s*")
+
+# count_tokens is an RPC, so remember recent results keyed by a hash of the text
+# Structure: { blake2b_digest: token_count }, least recently used first
+token_count_cache = OrderedDict()
+MAX_CACHED_TOKEN_COUNTS = 1024
+
+# Short strings (e.g. queries) aren't worth an RPC; the heuristic is close enough
+MIN_CHARS_FOR_TOKENIZER = 2000
+
+# The API rejects requests over 20 MB, so larger texts use the heuristic without trying
+MAX_TOKENIZER_REQUEST_BYTES = 20 * 1024 * 1024
+_token_count_lock = threading.Lock()
+
+_token_model = None
+
+# Page images sent to Gemini don't need lossless encoding
+AI_IMAGE_QUALITY = 70
+
+# Large documents are split into this many page-aligned chunks and searched in parallel
+try:
+    SEARCH_CHUNKS = max(1, int(os.getenv("SEARCH_CHUNKS", "4")))
+except ValueError:
+    print("Warning: SEARCH_CHUNKS is not an integer, using 4")
+    SEARCH_CHUNKS = 4
+
+# Documents below this many text tokens are searched in a single call
+SEARCH_CHUNK_MIN_TOKENS = 200000
+
+# Page markers written at upload time: "--- Page N of file.pdf ---"
+_PAGE_MARKER_RE = re.compile(r"\n--- Page (\d+) of (.+?) ---\n")
+
+# The File API deletes uploads after 48h; re-upload a little before that
+GEMINI_FILE_REFRESH_MARGIN = timedelta(minutes=10)
+
+# Deleting a dropped document's uploads is a blocking RPC per file, and documents are
+# dropped under the store lock (usually on the event loop), so it runs on this thread
+_file_cleanup_executor = ThreadPoolExecutor(max_workers=1)
+
+
+class DocumentStore:
+    """
+    Bounded in-memory LRU for document contents.
+    Least recently used documents are evicted on insert once there are more than
+    max_documents or their text exceeds max_chars characters. The TTL is sliding:
+    every get() refreshes a document's timestamp, and documents unused for
+    ttl_minutes are dropped on access or by expire().
+    A removed document's File API uploads are deleted in the background, and
+    on_evict, if set, is called with its ID so per-document data kept elsewhere
+    can be dropped with it.
+    """
+
+    def __init__(self, max_documents=100, max_chars=512 * 1024 * 1024, ttl_minutes=120):
+        self.max_documents = max_documents
+        self.max_chars = max_chars
+        self.ttl_minutes = ttl_minutes
+        self.on_evict = None
+        self._docs = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def _is_expired(self, doc_data, max_age_minutes, now):
+        return (now - doc_data["timestamp"]).total_seconds() / 60 > max_age_minutes
+
+    def _remove(self, doc_id):
+        doc_data = self._docs.pop(doc_id)
+        self._total_chars -= len(doc_data["content"])
+        _release_gemini_files(doc_data)
+        if self.on_evict is not None:
+            self.on_evict(doc_id)
+
+    def __setitem__(self, doc_id, doc_data):
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+            self._docs[doc_id] = doc_data
+            self._total_chars += len(doc_data["content"])
+
+            # Always keep the newest document, even if it is over budget on its own
+            while len(self._docs) > 1 and (
+                len(self._docs) > self.max_documents or self._total_chars > self.max_chars
+            ):
+                evicted_id = next(iter(self._docs))
+                self._remove(evicted_id)
+                print(f"Evicted document from store: {evicted_id}")
+
+    def get(self, doc_id):
+        """
+        Returns the stored document data, or None if it is missing or expired.
+        """
+        with self._lock:
+            doc_data = self._docs.get(doc_id)
+            if doc_data is None:
+                return None
+            now = datetime.now()
+            if self._is_expired(doc_data, self.ttl_minutes, now):
+                self._remove(doc_id)
+                return None
+            doc_data["timestamp"] = now
+            self._docs.move_to_end(doc_id)
+            return doc_data
+
+    def __getitem__(self, doc_id):
+        doc_data = self.get(doc_id)
+        if doc_data is None:
+            raise KeyError(doc_id)
+        return doc_data
+
+    def __contains__(self, doc_id):
+        return self.get(doc_id) is not None
+
+    def expire(self, max_age_minutes=None):
+        """
+        Drops every document unused for max_age_minutes (defaults to the store TTL).
+        Returns the removed document IDs.
+        """
+        if max_age_minutes is None:
+            max_age_minutes = self.ttl_minutes
+        now = datetime.now()
+
+        with self._lock:
+            expired = [
+                doc_id for doc_id, doc_data in self._docs.items()
+                if self._is_expired(doc_data, max_age_minutes, now)
+            ]
+            for doc_id in expired:
+                self._remove(doc_id)
+
+        return expired
+
+
+def _delete_gemini_files(gemini_files):
+    """
+    Deletes uploads from the File API instead of leaving them until their 48h expiry.
+    """
+    for gemini_file in gemini_files:
+        try:
+            genai.delete_file(gemini_file.name)
+        except Exception as e:
+            print(f"Error deleting Gemini file {gemini_file.name}: {e}")
+
+
+def _release_gemini_files(doc_data):
+    """
+    Schedules deletion of every File API upload held by a document.
+    """
+    gemini_files = list(doc_data.get("gemini_files", {}).values())
+    if gemini_files:
+        _file_cleanup_executor.submit(_delete_gemini_files, gemini_files)
+
+
 # In-memory storage for document contents (replaces caching)
-# Structure: { document_id: { "content": text, "timestamp": datetime } }
-document_store = {}
+# Structure: { document_id: { "content": text, "pdfs": [...], "text_tokens": int,
+#              "chunks": [(text_start, text_end, [(path, first_page, last_page), ...]), ...],
+#              "gemini_files": { (path, first_page, last_page): File }, "timestamp": last_used_datetime } }
+document_store = DocumentStore()
+
+def _get_token_model():
+    """
+    Lazily creates the model used for token counting.
+    """
+    global _token_model
+    if _token_model is None:
+        _token_model = genai.GenerativeModel(MODEL_NAME)
+    return _token_model
 
 def estimate_tokens(text):
     """
-    Estimates the number of tokens in a text string.
-    Rule of thumb: 1 token ~= 4 characters.
+    Counts the tokens in a text string with the model's real tokenizer.
+    Short strings, texts too big for one API request, and any text the API
+    can't count fall back to the rule of thumb: 1 token ~= 4 characters.
+    This may make a blocking RPC, so async callers should run it via asyncio.to_thread.
     """
     if not text:
         return 0
-    return len(text) // 4
+    if len(text) < MIN_CHARS_FOR_TOKENIZER:
+        return len(text) // 4
+    
+    encoded = text.encode()
+    if len(encoded) > MAX_TOKENIZER_REQUEST_BYTES:
+        return len(text) // 4
+    
+    key = hashlib.blake2b(encoded, digest_size=8).digest()
+    with _token_count_lock:
+        if key in token_count_cache:
+            token_count_cache.move_to_end(key)
+            return token_count_cache[key]
+    
+    try:
+        count = _get_token_model().count_tokens(text).total_tokens
+    except Exception as e:
+        print(f"Error counting tokens, falling back to estimate: {e}")
+        return len(text) // 4
+    
+    with _token_count_lock:
+        token_count_cache[key] = count
+        while len(token_count_cache) > MAX_CACHED_TOKEN_COUNTS:
+            token_count_cache.popitem(last=False)
+    
+    return count
 
 def estimate_image_tokens(num_images):
     """
@@ -30,35 +228,112 @@ def estimate_image_tokens(num_images):
     return num_images * 258
 
 
-def upload_to_cache(text_content, pdf_paths=None, ttl_minutes=60):
+async def _upload_page_range(path, first_page, last_page):
+    """
+    Uploads pages first_page..last_page (0-indexed, inclusive) of a PDF to Gemini's File API.
+    A range covering the whole file uploads the file itself; otherwise the pages
+    are copied into a new PDF in the worker pool first.
+    """
+    if first_page == 0 and last_page == get_doc(path).page_count - 1:
+        return await asyncio.to_thread(
+            genai.upload_file,
+            path,
+            mime_type="application/pdf",
+            display_name=os.path.basename(path)
+        )
+    
+    pdf_bytes = await asyncio.wrap_future(pdf_executor.submit(copy_page_range, path, first_page, last_page))
+    return await asyncio.to_thread(
+        genai.upload_file,
+        io.BytesIO(pdf_bytes),
+        mime_type="application/pdf",
+        display_name=f"{os.path.basename(path)} pages {first_page + 1}-{last_page + 1}"
+    )
+
+
+async def upload_pdfs_to_gemini(page_ranges):
+    """
+    Uploads PDF page ranges, given as (path, first_page, last_page), to Gemini's
+    File API so searches can reference them instead of re-sending rendered page
+    images with every request. Each upload is blocking network I/O, so they run
+    concurrently in threads.
+    Returns { (path, first_page, last_page): File }. Ranges that fail to upload
+    are left out and get rendered locally as a fallback.
+    """
+    page_ranges = list(page_ranges)
+    results = await asyncio.gather(
+        *(_upload_page_range(*page_range) for page_range in page_ranges),
+        return_exceptions=True
+    )
+    
+    gemini_files = {}
+    for page_range, result in zip(page_ranges, results):
+        if isinstance(result, Exception):
+            print(f"Error uploading {page_range} to Gemini: {result}")
+        else:
+            gemini_files[page_range] = result
+    return gemini_files
+
+
+def _is_expiring(gemini_file):
+    """
+    Returns True if a File API handle has expired or will within the refresh margin.
+    """
+    refresh_before = datetime.now(timezone.utc) + GEMINI_FILE_REFRESH_MARGIN
+    return bool(gemini_file.expiration_time and gemini_file.expiration_time <= refresh_before)
+
+
+async def refresh_gemini_files(doc_data):
+    """
+    Returns the Gemini file handles for a stored document, re-uploading any
+    that have expired (or are about to) on the File API. The store TTL is sliding,
+    so a document searched regularly can outlive its 48h uploads.
+    """
+    gemini_files = doc_data.setdefault("gemini_files", {})
+    
+    expired = [page_range for page_range, gemini_file in gemini_files.items() if _is_expiring(gemini_file)]
+    if expired:
+        print(f"Re-uploading {len(expired)} expired Gemini files")
+        for page_range in expired:
+            del gemini_files[page_range]
+        gemini_files.update(await upload_pdfs_to_gemini(expired))
+    
+    return gemini_files
+
+
+async def upload_to_cache(text_content, pdf_paths=None, total_pages=0, ttl_minutes=60):
     """
     Stores text content in memory instead of using Gemini's cache.
+    total_pages is the page count across all PDFs, used for the size estimate.
     Returns a unique document ID.
     """
     try:
         # Generate a unique document ID
         doc_id = f"doc_{uuid.uuid4().hex[:12]}"
+        pdf_paths = pdf_paths or []
+        
+        # Check document size
+        text_tokens = await asyncio.to_thread(estimate_tokens, text_content)
+        
+        # Decide the search split once, here, so a large document uploads each
+        # chunk's pages a single time rather than whole PDFs plus page ranges
+        num_chunks = SEARCH_CHUNKS if text_tokens > SEARCH_CHUNK_MIN_TOKENS else 1
+        chunks = _plan_chunks(text_content, pdf_paths, num_chunks)
+        gemini_files = await upload_pdfs_to_gemini(
+            {page_range for _, _, page_ranges in chunks for page_range in page_ranges}
+        )
         
         # Store the document content in memory
         document_store[doc_id] = {
             "content": text_content,
-            "pdfs": pdf_paths or [],
+            "pdfs": pdf_paths,
+            "text_tokens": text_tokens,
+            "chunks": chunks,
+            "gemini_files": gemini_files,
             "timestamp": datetime.now()
         }
         
-        # Check document size
-        text_tokens = estimate_tokens(text_content)
-        
-        # Estimate image tokens (we need to know total pages)
-        total_pages = 0
-        for path in (pdf_paths or []):
-            try:
-                doc = fitz.open(path)
-                total_pages += doc.page_count
-                doc.close()
-            except:
-                pass
-                
+        # Estimate image tokens from the caller's page count
         image_tokens = estimate_image_tokens(total_pages)
         total_tokens = text_tokens + image_tokens
         
@@ -77,64 +352,13 @@ def upload_to_cache(text_content, pdf_paths=None, ttl_minutes=60):
         print(f"Error storing document: {e}")
         return "error_creating_cache"
 
-def search_context(query, doc_id):
+def _search_prompt(query, text_content):
     """
-    Searches the stored document using Gemini's generative model.
-    Sends the full document content with each request instead of using cache.
+    Builds the search prompt for a query over (part of) the document text.
     """
-    # Check if document exists in store
-    if doc_id is None or doc_id == "error_creating_cache":
-        print(f"Searching for: {query} in doc: {doc_id}")
-        print("Warning: Document was not stored successfully. Cannot perform search.")
-        return "[]"
-    
-    if doc_id not in document_store:
-        print(f"Error: Document ID {doc_id} not found in store")
-        return "[]"
-    
-    try:
-        print(f"Searching for: {query} in document: {doc_id}")
-        
-        # Get the stored document content
-        doc_data = document_store[doc_id]
-        text_content = doc_data["content"]
-        pdf_paths = doc_data.get("pdfs", [])
-        
-        # Load images from PDFs in-memory
-        import PIL.Image
-        images = []
-        
-        for path in pdf_paths:
-            try:
-                if os.path.exists(path):
-                    doc = fitz.open(path)
-                    for page in doc:
-                        # Render page to image
-                        pix = page.get_pixmap(matrix=fitz.Matrix(1, 1)) # Standard resolution for AI is fine
-                        img_data = pix.tobytes("png")
-                        images.append(PIL.Image.open(io.BytesIO(img_data)))
-                    doc.close()
-            except Exception as e:
-                print(f"Error loading PDF {path}: {e}")
-
-
-        
-        # Create a generative model instance
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
-        # Check total tokens before sending
-        # Prompt template is small, main bulk is text_content
-        total_tokens = estimate_tokens(text_content) + estimate_image_tokens(len(images)) + estimate_tokens(query) + 500
-        
-        if total_tokens > 1000000: # 1M token limit for Flash
-             print(f"Error: Prompt too large ({total_tokens} tokens). limit is 1M.")
-             return "[]" # Return empty results if too large
-
-        
-        # Create the prompt with the document content and search query
-        prompt = f"""
-You are analyzing exam documents. I have provided the full text content AND images of every page.
-Use the images to understand diagrams, graphs, and layout. Use the text to read specific details.
+    return f"""
+You are analyzing exam documents. I have provided the full text content AND every page (as PDF files or page images).
+Use the pages to understand diagrams, graphs, and layout. Use the text to read specific details.
 
 DOCUMENT CONTENT:
 {text_content}
@@ -172,6 +396,7 @@ CRITICAL QUALITY REQUIREMENTS:
 
 7. **Source Identification**: You MUST identify which file the page belongs to.
    - Extract the filename from the header "--- Page X of [filename] ---".
+   - Always use the page number X from that header, not a page's position inside an attached PDF.
 
 Return a JSON list of objects, where each object has:
 - "page_number": The page number (1-indexed) where the question appears.
@@ -189,14 +414,190 @@ EXAMPLE GOOD OUTPUT:
 IMPORTANT: Only return the JSON array, no markdown formatting or code blocks.
 If no relevant questions are found, return an empty array: []
 """
+
+
+def _split_pages(text_content, num_chunks):
+    """
+    Splits document text into up to num_chunks chunks of similar size,
+    cutting only at page markers ("--- Page N of file.pdf ---").
+    Returns a list of (start, end, [(filename, page_number), ...]),
+    where text_content[start:end] is the chunk text.
+    """
+    markers = list(_PAGE_MARKER_RE.finditer(text_content))
+    if not markers:
+        return [(0, len(text_content), [])]
+    
+    target_size = len(text_content) / num_chunks
+    chunks = []
+    chunk_start = 0
+    chunk_pages = []
+    
+    for i, marker in enumerate(markers):
+        page_end = markers[i + 1].start() if i + 1 < len(markers) else len(text_content)
+        chunk_pages.append((marker.group(2), int(marker.group(1))))
+        
+        # Close the chunk once it has its share; the last chunk takes whatever is left
+        if page_end - chunk_start >= target_size and len(chunks) < num_chunks - 1 and page_end < len(text_content):
+            chunks.append((chunk_start, page_end, chunk_pages))
+            chunk_start = page_end
+            chunk_pages = []
+    
+    chunks.append((chunk_start, len(text_content), chunk_pages))
+    return chunks
+
+
+def _plan_chunks(text_content, pdf_paths, num_chunks):
+    """
+    Splits a document into up to num_chunks page-aligned search chunks.
+    Returns a list of (start, end, [(path, first_page, last_page), ...]): the chunk's
+    slice of text_content and the pages (0-indexed, inclusive) it needs from each PDF.
+    A chunk is a contiguous run of pages, so it needs one range per file.
+    """
+    split = _split_pages(text_content, num_chunks)
+    if len(split) == 1:
+        start, end, _ = split[0]
+        return [(start, end, [(path, 0, get_doc(path).page_count - 1) for path in pdf_paths])]
+    
+    # Page markers name the original file; stored paths are '{uuid}_{original_name}'
+    paths_by_name = {}
+    for path in pdf_paths:
+        paths_by_name.setdefault(os.path.basename(path).split("_", 1)[-1], []).append(path)
+    
+    chunks = []
+    for start, end, chunk_pages in split:
+        ranges = {}
+        for filename, page_number in chunk_pages:
+            for path in paths_by_name.get(filename, []):
+                first_page, last_page = ranges.get(path, (page_number - 1, page_number - 1))
+                ranges[path] = (min(first_page, page_number - 1), max(last_page, page_number - 1))
+        chunks.append((start, end, [(path, first_page, last_page) for path, (first_page, last_page) in ranges.items()]))
+    return chunks
+
+
+def _merge_results(responses):
+    """
+    Merges the JSON arrays returned for each chunk into one JSON array,
+    dropping duplicate (source_filename, page_number) results.
+    """
+    merged = {}
+    for response_text in responses:
+        try:
+            results = json.loads(_FENCE_RE.sub("", response_text).strip())
+        except ValueError as e:
+            print(f"Error parsing chunk response: {e}")
+            continue
+        if not isinstance(results, list):
+            print(f"Skipping chunk response that is not a JSON list: {type(results).__name__}")
+            continue
+        
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            key = (result.get("source_filename"), result.get("page_number") or result.get("page"))
+            merged.setdefault(key, result)
+    
+    return json.dumps(list(merged.values()))
+
+
+async def search_context(query, doc_id):
+    """
+    Searches the stored document using Gemini's generative model.
+    Large documents are split at upload time into SEARCH_CHUNKS page-aligned
+    chunks that are searched concurrently, and their results are merged.
+    """
+    # Check if document exists in store
+    if doc_id is None or doc_id == "error_creating_cache":
+        print(f"Searching for: {query} in doc: {doc_id}")
+        print("Warning: Document was not stored successfully. Cannot perform search.")
+        return "[]"
+    
+    doc_data = document_store.get(doc_id)
+    if doc_data is None:
+        print(f"Error: Document ID {doc_id} not found in store")
+        return "[]"
+    
+    try:
+        print(f"Searching for: {query} in document: {doc_id}")
+        
+        # Get the stored document content and the split planned at upload time
+        text_content = doc_data["content"]
+        text_tokens = doc_data["text_tokens"]
+        chunks = doc_data["chunks"]
+        gemini_files = await refresh_gemini_files(doc_data)
+        query_tokens = await asyncio.to_thread(estimate_tokens, query)
+        
+        # Uploaded page ranges are referenced directly; Gemini renders their pages itself.
+        # Only ranges that failed to upload are rendered to images here, in parallel workers.
+        render_tasks = []
+        for _, _, page_ranges in chunks:
+            for page_range in page_ranges:
+                if page_range in gemini_files:
+                    continue
+                path, first_page, last_page = page_range
+                for start in range(first_page, last_page + 1, PAGES_PER_TASK):
+                    stop = min(start + PAGES_PER_TASK, last_page + 1)
+                    task = pdf_executor.submit(render_pages_jpeg, path, start, stop, AI_IMAGE_QUALITY)
+                    render_tasks.append((page_range, task))
         
-        # Generate content with the model (Multimodal)
-        # Pass prompt string AND list of images
-        content_parts = [prompt] + images
-        response = model.generate_content(content_parts)
+        # Rendered pages by range, in page order.
+        # The SDK takes raw image bytes as inline parts, so there's no need to decode them.
+        page_images = {}
+        for page_range, task in render_tasks:
+            try:
+                page_images.setdefault(page_range, []).extend(
+                    {"mime_type": "image/jpeg", "data": img_data}
+                    for img_data in await asyncio.wrap_future(task)
+                )
+            except Exception as e:
+                print(f"Error rendering PDF {page_range[0]}: {e}")
+        
+        # Work out each chunk's parts and validate every chunk's size
+        # before starting any request, so nothing is left half-sent
+        chunk_requests = []
+        for start, end, page_ranges in chunks:
+            content_parts = []
+            pages_sent = 0
+            
+            for page_range in page_ranges:
+                if page_range in gemini_files:
+                    path, first_page, last_page = page_range
+                    content_parts.append(gemini_files[page_range])
+                    pages_sent += last_page - first_page + 1
+                else:
+                    images = page_images.get(page_range, [])
+                    content_parts.extend(images)
+                    pages_sent += len(images)
+            
+            # Check total tokens before sending
+            # Prompt template is small, main bulk is the chunk text
+            chunk_tokens = text_tokens * (end - start) // max(len(text_content), 1)
+            total_tokens = chunk_tokens + estimate_image_tokens(pages_sent) + query_tokens + 500
+            
+            if total_tokens > 1000000: # 1M token limit for Flash
+                 print(f"Error: Prompt too large ({total_tokens} tokens). limit is 1M.")
+                 return "[]" # Return empty results if too large
+            
+            chunk_requests.append([_search_prompt(query, text_content[start:end])] + content_parts)
+        
+        # Generate content with the model (Multimodal), all chunks concurrently
+        model = genai.GenerativeModel(MODEL_NAME)
+        calls = [model.generate_content_async(content_parts) for content_parts in chunk_requests]
+        responses = await asyncio.gather(*calls, return_exceptions=True)
+        
+        response_texts = []
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"Error searching chunk: {response}")
+            else:
+                response_texts.append(response.text)
         
-        print(f"AI Response received: {len(response.text)} characters")
-        return response.text
+        print(f"AI Response received: {sum(len(text) for text in response_texts)} characters from {len(response_texts)}/{len(chunks)} chunks")
+        
+        if not response_texts:
+            return "[]"
+        if len(chunks) == 1:
+            return response_texts[0]
+        return _merge_results(response_texts)
         
     except Exception as e:
         print(f"Error searching context: {e}")
@@ -204,37 +605,26 @@ If no relevant questions are found, return an empty array: []
 
 def cleanup_old_documents(max_age_minutes=120):
     """
-    Optional: Remove old documents from memory to prevent unlimited growth.
-    Call this periodically if needed.
+    Removes documents unused for max_age_minutes from memory.
+    The store already evicts on insert; this just frees expired documents sooner.
     """
-    current_time = datetime.now()
-    to_remove = []
-    
-    for doc_id, doc_data in document_store.items():
-        age = (current_time - doc_data["timestamp"]).total_seconds() / 60
-        if age > max_age_minutes:
-            to_remove.append(doc_id)
-    
-    for doc_id in to_remove:
-        del document_store[doc_id]
+    removed = document_store.expire(max_age_minutes)
+    for doc_id in removed:
         print(f"Cleaned up old document: {doc_id}")
     
-    return len(to_remove)
+    return len(removed)
 
-def generate_pdf_instant(query, doc_id):
+async def generate_pdf_instant(query, doc_id):
     """
     Uses AI to find relevant pages for instant PDF generation.
     Returns a list of page numbers that match the query.
     """
     # First, use search_context to find matching pages
-    results_json = search_context(query, doc_id)
+    results_json = await search_context(query, doc_id)
     
     try:
-        import json
-        import re
-        
         # Clean up potential markdown code blocks
-        cleaned_json = re.sub(r"```json|```", "", results_json).strip()
+        cleaned_json = _FENCE_RE.sub("", results_json).strip()
         parsed_results = json.loads(cleaned_json)
         
         # Extract page numbers from results
@@ -4,20 +4,57 @@ from dotenv import load_dotenv
 # Load .env from parent directory
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Request
+from fastapi.responses import Response
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
-import shutil
 import uuid
+import aiofiles
+import json
+import re
+import logging
 import fitz # PyMuPDF
-import io
-from ai import upload_to_cache, search_context, generate_pdf_instant
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from ai import upload_to_cache, search_context, generate_pdf_instant, cleanup_old_documents, document_store
+from pdf_cache import get_doc, cleanup_old_handles, extract_pages, pdf_executor, PAGES_PER_TASK
 
-app = FastAPI(title="ExamForge API")
+# Matches markdown code fences (```json / ```) the model sometimes wraps its JSON in
+_FENCE_RE = re.compile(r"```(?:json)?\s*")
+
+# How often to sweep idle PDF handles and expired documents
+CLEANUP_INTERVAL_SECONDS = 60
+
+
+async def periodic_cleanup():
+    """
+    Background task that frees idle PDF handles and expired documents.
+    """
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        closed = cleanup_old_handles()
+        if closed:
+            print(f"Closed {closed} idle PDF handles")
+        cleanup_old_documents()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    cleanup_task = asyncio.create_task(periodic_cleanup())
+    yield
+    cleanup_task.cancel()
+    # Stop worker processes so they don't outlive --reload restarts
+    pdf_executor.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="ExamForge API", lifespan=lifespan)
+
+# Per-result search tracing goes through logging so it stays quiet unless DEBUG is enabled
+logger = logging.getLogger(__name__)
 
 # CORS Setup
 app.add_middleware(
@@ -35,6 +72,13 @@ OUTPUT_DIR = os.getenv("OUTPUT_DIR", "./storage/generated")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Rendered thumbnails are written through to disk so they survive restarts
+THUMB_CACHE_DIR = os.path.join(UPLOAD_DIR, ".thumb_cache")
+os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+
 # Serve static files (uploaded PDFs/Images) for the frontend to access
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 app.mount("/generated", StaticFiles(directory=OUTPUT_DIR), name="generated")
@@ -42,6 +86,152 @@ app.mount("/generated", StaticFiles(directory=OUTPUT_DIR), name="generated")
 # Store document metadata: { doc_id: { "files": [...uploaded files info...] } }
 document_metadata = {}
 
+# Drop a document's metadata whenever the store evicts or expires its content
+document_store.on_evict = lambda doc_id: document_metadata.pop(doc_id, None)
+
+# Lookup indexes for uploaded PDFs so requests don't have to scan UPLOAD_DIR
+# file_index: { file_id: abs_path }, orig_name_index: { original_name: abs_path }
+file_index = {}
+orig_name_index = {}
+_file_index_rebuilt = False
+
+# In-memory LRU of rendered thumbnails, least recently used first
+# Structure: { (file_id, page_num, width, fmt): image_bytes }
+thumbnail_cache = OrderedDict()
+MAX_CACHED_THUMBNAILS = 256
+
+# Thumbnails are lossy-encoded: much faster than PNG deflate and far smaller payloads
+THUMBNAIL_FORMATS = {"jpg": "image/jpeg", "webp": "image/webp"}
+THUMBNAIL_QUALITY = 75
+
+# Requested widths are rounded up to one of these (in pixels) so renders can be reused
+THUMBNAIL_WIDTHS = (120, 300, 800, 1600)
+DEFAULT_THUMBNAIL_WIDTH = 800
+
+
+def _index_file(file_id, original_name, path):
+    """
+    Registers an uploaded PDF in the lookup indexes.
+    """
+    abs_path = os.path.abspath(path)
+    file_index[file_id] = abs_path
+    orig_name_index[original_name] = abs_path
+
+
+def _rebuild_file_index():
+    """
+    Fills missing index entries from UPLOAD_DIR (e.g. after a server restart).
+    Files are stored as {file_id}_{original_name}, so both keys can be recovered.
+    Existing entries are kept, and if several files share an original name the newest wins.
+    Uploads always go through _index_file, so the directory only needs scanning once.
+    """
+    global _file_index_rebuilt
+    if _file_index_rebuilt:
+        return
+    _file_index_rebuilt = True
+    
+    newest_by_name = {}
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".pdf") and "_" in entry.name:
+                file_id, original_name = entry.name.split("_", 1)
+                abs_path = os.path.abspath(entry.path)
+                file_index.setdefault(file_id, abs_path)
+                
+                mtime = entry.stat().st_mtime
+                if original_name not in newest_by_name or mtime > newest_by_name[original_name][0]:
+                    newest_by_name[original_name] = (mtime, abs_path)
+    
+    for original_name, (_, abs_path) in newest_by_name.items():
+        orig_name_index.setdefault(original_name, abs_path)
+
+
+def resolve_file_id(file_id):
+    """
+    Returns the absolute path of an uploaded PDF by its file_id, or None.
+    """
+    path = file_index.get(file_id)
+    if path is None:
+        _rebuild_file_index()
+        path = file_index.get(file_id)
+    return path
+
+
+def resolve_source_pdf(name):
+    """
+    Returns the absolute path of an uploaded PDF by its original or stored name, or None.
+    """
+    path = orig_name_index.get(name)
+    if path is not None:
+        return path
+    
+    # The frontend may also send the stored '{uuid}_{original_name}' name
+    exact_path = os.path.join(UPLOAD_DIR, name)
+    if os.path.exists(exact_path):
+        return os.path.abspath(exact_path)
+    
+    _rebuild_file_index()
+    return orig_name_index.get(name)
+
+
+def _thumbnail_width(width):
+    """
+    Rounds a requested width up to the nearest allowed thumbnail width.
+    """
+    for allowed in THUMBNAIL_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def get_thumbnail_bytes(file_id, page_num, width=DEFAULT_THUMBNAIL_WIDTH, fmt="jpg"):
+    """
+    Returns the encoded bytes ("jpg" or "webp") for a page thumbnail
+    rendered `width` pixels wide, or None if the file or page doesn't exist.
+    Looks in the in-memory LRU first, then the on-disk cache, and only renders on a miss.
+    """
+    key = (file_id, page_num, width, fmt)
+    
+    img_data = thumbnail_cache.get(key)
+    if img_data is not None:
+        thumbnail_cache.move_to_end(key)
+        return img_data
+    
+    disk_path = os.path.join(THUMB_CACHE_DIR, file_id, f"{page_num}_{width}w.{fmt}")
+    if os.path.exists(disk_path):
+        with open(disk_path, "rb") as f:
+            img_data = f.read()
+    else:
+        target_file = resolve_file_id(file_id)
+        if not target_file:
+            return None
+        
+        doc = get_doc(target_file)
+        if page_num < 0 or page_num >= doc.page_count:
+            return None
+        
+        # Rendering cost scales with pixel count, so only render as wide as asked
+        page = doc[page_num]
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        if fmt == "webp":
+            img_data = pix.pil_tobytes(format="WEBP", quality=THUMBNAIL_QUALITY)
+        else:
+            img_data = pix.tobytes("jpg", jpg_quality=THUMBNAIL_QUALITY)
+        
+        # Write atomically so concurrent readers never see a partial file
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        tmp_path = f"{disk_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(img_data)
+        os.replace(tmp_path, disk_path)
+    
+    thumbnail_cache[key] = img_data
+    while len(thumbnail_cache) > MAX_CACHED_THUMBNAILS:
+        thumbnail_cache.popitem(last=False)
+    
+    return img_data
+
 
 class SearchQuery(BaseModel):
     query: str
@@ -59,6 +249,67 @@ class GenerateRequest(BaseModel):
 async def root():
     return {"message": "ExamForge API is running"}
 
+async def _process_one(file, executor):
+    """
+    Saves one uploaded PDF and extracts its text in the worker pool.
+    Returns (file_info, file_text), or None if the file isn't a PDF.
+    """
+    # Validate file type
+    if not file.filename.lower().endswith('.pdf'):
+        print(f"Skipping non-PDF file: {file.filename}")
+        return None
+
+    file_id = str(uuid.uuid4())
+    safe_filename = f"{file_id}_{file.filename}"
+    file_path = os.path.join(UPLOAD_DIR, safe_filename)
+    
+    # Stream to disk in large chunks without blocking the event loop
+    async with aiofiles.open(file_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
+    
+    _index_file(file_id, file.filename, file_path)
+        
+    # Only read the page count here; text extraction happens in the worker pool
+    page_count = get_doc(file_path).page_count
+    
+    # Dispatch one task per page range so big PDFs are spread across workers,
+    # then reassemble pages in order
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(executor, extract_pages, file_path, start, start + PAGES_PER_TASK)
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ))
+    pages = sorted(page for chunk in chunks for page in chunk)
+    
+    # Accumulate text in a list and join once; repeated += on big strings is quadratic
+    file_parts = []
+    page_map = {}
+    
+    for page_num, text in pages:
+        # Check for empty text (scanned page detection)
+        if not text.strip():
+            print(f"Warning: Page {page_num + 1} of {file.filename} appears to be empty or scanned image.")
+            text = f"\n[WARNING: Page {page_num + 1} contains no extractable text - it may be an image or scanned document. The AI cannot read this page.]\n"
+        
+        # Add page marker for the AI to know where it is
+        file_parts.append(f"\n--- Page {page_num + 1} of {file.filename} ---\n{text}")
+        
+        # Thumbnails are generated on-the-fly via /thumbnail endpoint
+        page_map[page_num + 1] = f"/thumbnail/{file_id}/{page_num}"
+        
+    file_text = "".join(file_parts)
+    
+    file_info = {
+        "filename": safe_filename,
+        "original_name": file.filename,
+        "id": file_id,
+        "page_count": page_count,
+        "pages": page_map
+    }
+    return file_info, file_text
+
+
 @app.post("/upload")
 async def upload_documents(files: List[UploadFile] = File(...)):
     """
@@ -66,64 +317,20 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     Returns the cache_id and file metadata.
     """
     uploaded_files = []
-    all_text_content = ""
+    all_text_parts = []
     
-    # Map to store page images: { "filename_pageIndex": "url_to_image" }
-    # But simpler: just return the base URL pattern or a list of images per file.
+    # Process all files concurrently; gather keeps the results in upload order
+    results = await asyncio.gather(*(_process_one(file, pdf_executor) for file in files))
     
-    for file in files:
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            print(f"Skipping non-PDF file: {file.filename}")
+    for result in results:
+        if result is None:
             continue
+        file_info, file_text = result
+        all_text_parts.append(f"\n=== Document: {file_info['original_name']} ===\n{file_text}")
+        uploaded_files.append(file_info)
 
-        file_id = str(uuid.uuid4())
-        safe_filename = f"{file_id}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, safe_filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Process PDF with PyMuPDF
-        doc = fitz.open(file_path)
-        file_text = ""
-        
-        # Create a directory for this file's page images to keep things organized
-        # images_dir = os.path.join(UPLOAD_DIR, "images", file_id)
-        # os.makedirs(images_dir, exist_ok=True)
-        
-        page_map = {}
-        
-        for page_num, page in enumerate(doc):
-            # 1. Extract Text
-            text = page.get_text()
-            
-            # Check for empty text (scanned page detection)
-            if not text.strip():
-                print(f"Warning: Page {page_num + 1} of {file.filename} appears to be empty or scanned image.")
-                text = f"\n[WARNING: Page {page_num + 1} contains no extractable text - it may be an image or scanned document. The AI cannot read this page.]\n"
-            
-            # Add page marker for the AI to know where it is
-            file_text += f"\n--- Page {page_num + 1} of {file.filename} ---\n{text}"
-            
-            # 2. Generate Image (High Res) - REMOVED for storage optimization
-            # We now generate thumbnails on-the-fly via /thumbnail endpoint
-            
-            # URL to access this image (Dynamic)
-            page_map[page_num + 1] = f"/thumbnail/{file_id}/{page_num}"
-            
-        page_count = doc.page_count
-        doc.close()
-        all_text_content += f"\n=== Document: {file.filename} ===\n{file_text}"
-        
-        uploaded_files.append({
-            "filename": safe_filename,
-            "original_name": file.filename,
-            "id": file_id,
-            "page_count": page_count,
-            "pages": page_map
-        })
-
+    all_text_content = "".join(all_text_parts)
+    
     # Upload to Gemini Context Cache
     print("Uploading to Gemini Cache...")
     
@@ -136,7 +343,8 @@ async def upload_documents(files: List[UploadFile] = File(...)):
         all_pdf_paths.append(abs_path)
             
     # Pass PDF paths instead of image paths
-    cache_id = upload_to_cache(all_text_content, pdf_paths=all_pdf_paths)
+    total_pages = sum(f["page_count"] for f in uploaded_files)
+    cache_id = await upload_to_cache(all_text_content, pdf_paths=all_pdf_paths, total_pages=total_pages)
     
     if not cache_id:
         # Fallback if cache creation fails (e.g. API key issue)
@@ -156,36 +364,36 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     }
 
 @app.get("/thumbnail/{file_id}/{page_num}")
-async def get_thumbnail(file_id: str, page_num: int):
+async def get_thumbnail(file_id: str, page_num: int, request: Request, w: int = DEFAULT_THUMBNAIL_WIDTH, fmt: str = "jpg"):
     """
-    Generates a PNG thumbnail for a specific page of a PDF on-the-fly.
+    Returns a JPEG (or WebP with ?fmt=webp) thumbnail for a specific page of a PDF.
+    ?w= sets the width in pixels, rounded up to one of THUMBNAIL_WIDTHS.
+    Thumbnails are rendered on first request and cached in memory and on disk.
     """
-    # Find the file with this ID
-    # We don't have a direct DB, so we have to search the uploads dir or use metadata if available.
-    # But wait, we saved files as {file_id}_{filename}.
-    # Let's search for a file starting with file_id in UPLOAD_DIR.
-    
-    target_file = None
-    for filename in os.listdir(UPLOAD_DIR):
-        if filename.startswith(file_id) and filename.endswith(".pdf"):
-            target_file = os.path.join(UPLOAD_DIR, filename)
-            break
+    target_file = resolve_file_id(file_id)
             
     if not target_file:
         raise HTTPException(status_code=404, detail="File not found")
+    
+    if fmt not in THUMBNAIL_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported thumbnail format {fmt}")
         
     try:
-        doc = fitz.open(target_file)
-        if page_num < 0 or page_num >= doc.page_count:
-            doc.close()
+        width = _thumbnail_width(w)
+        
+        # Uploaded files never change, so let browsers revalidate cheaply with an ETag
+        etag = f'"{file_id}-{int(os.path.getmtime(target_file))}-{page_num}-{width}-{fmt}"'
+        headers = {"Cache-Control": "public, max-age=86400", "ETag": etag}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        
+        img_data = get_thumbnail_bytes(file_id, page_num, width, fmt)
+        if img_data is None:
             raise HTTPException(status_code=404, detail="Page not found")
-            
-        page = doc[page_num]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2)) # 2x zoom
-        img_data = pix.tobytes("png")
-        doc.close()
         
-        return StreamingResponse(io.BytesIO(img_data), media_type="image/png")
+        return Response(content=img_data, media_type=THUMBNAIL_FORMATS[fmt], headers=headers)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         print(f"Error generating thumbnail: {e}")
         raise HTTPException(status_code=500, detail="Error generating thumbnail")
@@ -199,40 +407,36 @@ async def search_documents(search_req: SearchQuery):
     if search_req.cache_id == "error_creating_cache":
          return {"results": [], "error": "Cache was not created successfully."}
 
-    results_json = search_context(search_req.query, search_req.cache_id)
+    results_json = await search_context(search_req.query, search_req.cache_id)
     
     # ai.py returns a string (JSON), we need to parse it if it's a string, 
     # or if search_context already returns a dict/list.
     # Let's check ai.py. It returns response.text.
     # We should try to parse it here to ensure valid JSON for the frontend.
-    import json
-    import re
-    
     try:
         # Clean up potential markdown code blocks ```json ... ```
-        cleaned_json = re.sub(r"```json|```", "", results_json).strip()
+        cleaned_json = _FENCE_RE.sub("", results_json).strip()
         parsed_results = json.loads(cleaned_json)
         
+        # Normalize the page field once; the model sometimes answers with "page"
+        for result in parsed_results:
+            page = result.pop("page", None)
+            result["page_number"] = result.get("page_number") or page
+        
         # Enrich results with image URLs
-        print(f"Enriching results. cache_id: {search_req.cache_id}, metadata keys: {list(document_metadata.keys())}")
+        logger.debug("Enriching results. cache_id: %s, metadata keys: %s", search_req.cache_id, document_metadata.keys())
         if search_req.cache_id in document_metadata:
             files_info = document_metadata[search_req.cache_id]["files"]
-            print(f"Found {len(files_info)} files in metadata")
+            files_by_name = {f_info["original_name"]: f_info for f_info in files_info}
+            logger.debug("Found %s files in metadata", len(files_info))
             
             for result in parsed_results:
-                page_num = result.get("page_number") or result.get("page")
-                print(f"Processing result: page_num={page_num}, result={result}")
+                page_num = result["page_number"]
+                logger.debug("Processing result: page_num=%s, result=%s", page_num, result)
                 
                 # Find which file this page belongs to
-                target_file_info = None
                 source_filename = result.get("source_filename")
-                
-                if source_filename:
-                    # Try to find exact match
-                    for f_info in files_info:
-                        if f_info["original_name"] == source_filename:
-                            target_file_info = f_info
-                            break
+                target_file_info = files_by_name.get(source_filename)
                 
                 # Fallback: If no filename returned or not found, use the first file (legacy behavior)
                 # OR try to find which file has this page number if unique? No, that's risky.
@@ -241,16 +445,16 @@ async def search_documents(search_req: SearchQuery):
                     target_file_info = files_info[0]
 
                 if target_file_info:
-                    print(f"Mapped result to file: {target_file_info['original_name']}")
+                    logger.debug("Mapped result to file: %s", target_file_info["original_name"])
                     # Get the image URL for this page
                     if page_num and page_num in target_file_info.get("pages", {}):
                         result["image_url"] = target_file_info["pages"][page_num]
                         result["source_filename"] = target_file_info["original_name"]
-                        print(f"Added image_url: {result['image_url']}")
+                        logger.debug("Added image_url: %s", result["image_url"])
                     else:
                         result["image_url"] = None
                         result["source_filename"] = target_file_info.get("original_name", "")
-                        print(f"Page {page_num} not found in pages of {target_file_info['original_name']}")
+                        logger.debug("Page %s not found in pages of %s", page_num, target_file_info["original_name"])
         else:
             print(f"cache_id {search_req.cache_id} not found in metadata")
         
@@ -274,37 +478,40 @@ async def generate_pdf(req: GenerateRequest):
         # Create new PDF document
         output_doc = fitz.open()
         
+        # Resolve each source once and validate every selection before copying anything
+        source_paths = {}
         for sel in req.selections:
-            # Resolve full path for source PDF
-            # The frontend sends 'original_name', but we stored it as '{uuid}_{original_name}'
-            # We need to find the file in UPLOAD_DIR that ends with _{original_name}
-            full_path = None
-            
-            # First check if it exists exactly (legacy or if we start sending safe names)
-            if os.path.exists(os.path.join(UPLOAD_DIR, sel.source_pdf)):
-                full_path = os.path.join(UPLOAD_DIR, sel.source_pdf)
-            else:
-                # Search for it
-                for f in os.listdir(UPLOAD_DIR):
-                    if f.endswith(f"_{sel.source_pdf}"):
-                        full_path = os.path.join(UPLOAD_DIR, f)
-                        break
-            
-            if not full_path or not os.path.exists(full_path):
-                print(f"Error: Source file {sel.source_pdf} not found in {UPLOAD_DIR}")
-                raise HTTPException(status_code=404, detail=f"Source file {sel.source_pdf} not found")
-            
-            # Open source PDF and extract the page
-            src_doc = fitz.open(full_path)
+            if sel.source_pdf not in source_paths:
+                # The frontend sends 'original_name', but we stored it as '{uuid}_{original_name}'
+                full_path = resolve_source_pdf(sel.source_pdf)
+                
+                if not full_path or not os.path.exists(full_path):
+                    print(f"Error: Source file {sel.source_pdf} not found in {UPLOAD_DIR}")
+                    raise HTTPException(status_code=404, detail=f"Source file {sel.source_pdf} not found")
+                
+                source_paths[sel.source_pdf] = full_path
             
             # Validate page number
-            if sel.page_number < 0 or sel.page_number >= src_doc.page_count:
-                src_doc.close()
+            if sel.page_number < 0 or sel.page_number >= get_doc(source_paths[sel.source_pdf]).page_count:
                 raise HTTPException(status_code=400, detail=f"Invalid page number {sel.page_number}")
-            
-            page = src_doc[sel.page_number]
-            
-            # Apply crop if specified
+        
+        # Merge consecutive selections of adjacent pages from the same source into runs,
+        # so each run is copied with a single insert_pdf call while keeping the selection order
+        runs = [] # [source_pdf, from_page, to_page]
+        for sel in req.selections:
+            if runs and runs[-1][0] == sel.source_pdf and runs[-1][2] + 1 == sel.page_number:
+                runs[-1][2] = sel.page_number
+            else:
+                runs.append([sel.source_pdf, sel.page_number, sel.page_number])
+        
+        for source_pdf, from_page, to_page in runs:
+            # Source documents come from the shared handle cache, so don't close them
+            src_doc = get_doc(source_paths[source_pdf])
+            output_doc.insert_pdf(src_doc, from_page=from_page, to_page=to_page)
+        
+        # Apply crops on the copied pages, since the sources are shared.
+        # Output page i is selection i.
+        for page, sel in zip(output_doc, req.selections):
             if sel.crop_box:
                 # crop_box is [x, y, w, h] normalized (0-1)
                 try:
@@ -322,11 +529,6 @@ async def generate_pdf(req: GenerateRequest):
                 except Exception as e:
                     print(f"Error checking cropbox: {e}")
                     # Continue without cropping if error
-            
-            # Copy the full page to output document
-            output_doc.insert_pdf(src_doc, from_page=sel.page_number, to_page=sel.page_number)
-            
-            src_doc.close()
         
         # Save the output PDF
         output_doc.save(output_path)
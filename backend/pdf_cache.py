@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import fitz # PyMuPDF
+
+
+# Keep recently used PDFs open so hot documents aren't re-parsed on every request
+MAX_OPEN_DOCUMENTS = 32
+DOCUMENT_TTL_MINUTES = 10
+
+# In-memory LRU of open documents, least recently used first
+# Structure: { abs_path: (fitz.Document, last_used_monotonic) }
+_open_documents = OrderedDict()
+_lock = threading.Lock()
+
+# Worker pool for CPU-bound PyMuPDF work (text extraction, page rendering).
+# fitz is not thread-safe and holds the GIL, so we scale with processes instead of threads.
+pdf_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# Large PDFs are split into page ranges of this size so one file can use several workers
+PAGES_PER_TASK = 50
+
+# Cheaper than the default text flags: skip ligature and whitespace preservation,
+# which the AI doesn't need, but keep clipping to the page and unknown-glyph fallback
+TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_CID_FOR_UNKNOWN_UNICODE
+
+
+def get_doc(path):
+    """
+    Returns an open fitz.Document for a PDF path, reusing a cached handle on hit.
+    The cache owns the handle: callers must NOT close it or modify its pages.
+    """
+    path = os.path.abspath(path)
+
+    with _lock:
+        entry = _open_documents.get(path)
+        if entry is not None:
+            doc = entry[0]
+            _open_documents[path] = (doc, time.monotonic())
+            _open_documents.move_to_end(path)
+            return doc
+
+        doc = fitz.open(path)
+        _open_documents[path] = (doc, time.monotonic())
+
+        # Evict least recently used handles when over capacity
+        while len(_open_documents) > MAX_OPEN_DOCUMENTS:
+            _, (old_doc, _) = _open_documents.popitem(last=False)
+            old_doc.close()
+
+        return doc
+
+
+def cleanup_old_handles(max_age_minutes=DOCUMENT_TTL_MINUTES):
+    """
+    Closes and evicts documents that haven't been used for max_age_minutes.
+    Returns the number of handles closed.
+    """
+    cutoff = time.monotonic() - max_age_minutes * 60
+
+    with _lock:
+        expired = [path for path, (_, last_used) in _open_documents.items() if last_used < cutoff]
+        for path in expired:
+            doc, _ = _open_documents.pop(path)
+            doc.close()
+
+    return len(expired)
+
+
+# Worker functions for pdf_executor. They live here rather than in main.py or ai.py
+# so worker processes only import this module, and each opens its own fitz document.
+
+def extract_pages(path, start=0, stop=None):
+    """
+    Extracts text from pages [start, stop) of a PDF.
+    Returns a list of (page_idx, text) tuples.
+    """
+    doc = fitz.open(path)
+    if stop is None or stop > doc.page_count:
+        stop = doc.page_count
+    pages = [
+        (page_num, doc[page_num].get_text("text", flags=TEXT_FLAGS, sort=False))
+        for page_num in range(start, stop)
+    ]
+    doc.close()
+    return pages
+
+
+def render_pages_jpeg(path, start, stop, quality):
+    """
+    Renders pages [start, stop) of a PDF to JPEG bytes at standard resolution.
+    """
+    doc = fitz.open(path)
+    if stop > doc.page_count:
+        stop = doc.page_count
+    images = [
+        doc[page_num].get_pixmap(matrix=fitz.Matrix(1, 1)).tobytes("jpg", jpg_quality=quality)
+        for page_num in range(start, stop)
+    ]
+    doc.close()
+    return images
+
+
+def copy_page_range(path, first_page, last_page):
+    """
+    Copies pages first_page..last_page (0-indexed, inclusive) of a PDF into a new PDF.
+    Returns the new PDF's bytes.
+    """
+    src = fitz.open(path)
+    doc = fitz.open()
+    doc.insert_pdf(src, from_page=first_page, to_page=last_page)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    src.close()
+    return pdf_bytes
@@ -68,7 +68,7 @@ const addToCart = (result, crop = null) => {
   const newItem = {
     id: Date.now(),
     source_pdf: result.source_filename || (files.length > 0 ? files[0].filename : ''),
-    page_number: (result.page_number || result.page) - 1,
+    page_number: result.page_number - 1,
     order: cart.length,
     description: result.description,
     crop_box: crop
@@ -267,7 +267,7 @@ return (
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6 pb-12">
             {searchResults.map((result, idx) => {
               const imageUrl = getImageUrl(result);
-              const pageNum = result.page_number || result.page;
+              const pageNum = result.page_number;
 
               return (
                 <div key={idx} className="group flex flex-col">
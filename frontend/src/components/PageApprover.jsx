@@ -64,8 +64,9 @@ const PageApprover = ({ imageUrl, pageNumber, questionInfo, onApprove }) => {
                 </div>
             )}
 
+            {/* Cropping needs more detail than the card preview */}
             <CropperModal
-                imageUrl={imageUrl}
+                imageUrl={imageUrl && `${imageUrl}?w=1600`}
                 isOpen={isCropperOpen}
                 onClose={() => setIsCropperOpen(false)}
                 onConfirm={(crop) => {